@@ -1,10 +1,22 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
-import json
+import orjson
 import os
-from datetime import datetime, timedelta
+import socket
+import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import chain
+import threading
+from operator import itemgetter
+from types import MappingProxyType
 import logging
 from dotenv import load_dotenv
+from pybloom_live import BloomFilter
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,6 +32,65 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Notifications found in one polling cycle are joined into digests of at most this many
+# characters (Telegram rejects message bodies over 4096)
+MAX_BATCH_CHARS = 3800
+MESSAGE_SEPARATOR = "\n\n─────\n\n"
+
+# Popular TRC-20 tokens to monitor (contract address -> symbol), read-only
+TRC20_CONTRACTS = MappingProxyType({
+    "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t": "USDT",  # Tether USD
+#     "TEkxiTehnzSmSe2XqrBj4w32RUN966rdz8": "USDC",   # USD Coin
+#     "TUpMhErZL2fhh4sVNULAbNKLokS4GjC1F4": "TUSD",   # TrueUSD
+#     "TLf2b2kPL7joeax6PmGZeQjEFnTEk8bsHH": "BTT",    # BitTorrent Token
+})
+
+# Fields read by the message formatters, fetched in a single C-level call
+_TX_GET = itemgetter('hash', 'timestamp', 'block', 'ownerAddress', 'toAddress', 'amount', 'contractType')
+_TRANSFER_GET = itemgetter(
+    'hash', 'block_timestamp', 'block', 'from', 'to', 'amount', 'token_name',
+    'decimals', 'contract_address', 'status', 'direction'
+)
+
+# How long processed transaction hashes are kept in the state database
+SEEN_RETENTION_MS = 24 * 60 * 60 * 1000
+
+# Powers of ten for token decimals, so amounts are scaled without recomputing 10 ** decimals
+DECIMAL_DIVISORS = {d: 10 ** d for d in range(0, 19)}
+
+def _fmt_amount(amount, decimals, grouping=False):
+    """Format an integer base-unit amount to 6 decimal places using integer math only"""
+    divisor = DECIMAL_DIVISORS.get(decimals, 10 ** decimals)
+    sign = "-" if amount < 0 else ""
+    # Scale to micro-units and round half up, so no float ever touches the amount
+    micro, remainder = divmod(abs(amount) * 1_000_000, divisor)
+    if remainder * 2 >= divisor:
+        micro += 1
+    whole, frac = divmod(micro, 1_000_000)
+    return f"{sign}{whole:,}.{frac:06d}" if grouping else f"{sign}{whole}.{frac:06d}"
+
+@lru_cache(maxsize=1024)
+def _fmt_ts(ts_ms):
+    """Format a millisecond timestamp for notifications (cached, since polls repeat them)"""
+    dt = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+    return dt.strftime('%Y-%m-%d %H:%M:%S UTC')
+
+class _RateLimiter:
+    """Blocks only when more than `rate` calls would happen within `period` seconds"""
+    def __init__(self, rate, period=1.0):
+        self._period = period
+        self._sent = deque(maxlen=rate)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until another call fits in the window, then record it"""
+        with self._lock:
+            if len(self._sent) == self._sent.maxlen:
+                wait = self._sent[0] + self._period - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            self._sent.append(time.monotonic())
+
 class TronTransactionMonitor:
     def __init__(self):
         # Configuration - Set these values
@@ -28,16 +99,87 @@ class TronTransactionMonitor:
         self.TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID', 'YOUR_CHAT_ID_HERE')
         self.TRONSCAN_API_KEY = os.getenv('TRONSCAN_API_KEY', '')  # Optional but recommended
         self.INTERVAL = int(os.getenv("INTERVAL_SECOND",30))
+        self.STATE_DB = os.getenv("STATE_DB", "state.db")
+        # Bounds for the adaptive poll interval (shrinks on activity, grows when idle)
+        self.MIN_INTERVAL = int(os.getenv("MIN_INTERVAL_SECOND",5))
+        self.MAX_INTERVAL = int(os.getenv("MAX_INTERVAL_SECOND",300))
+        self._cur_interval = min(max(self.INTERVAL, self.MIN_INTERVAL), self.MAX_INTERVAL)
         # API endpoints
         self.TRONSCAN_API_BASE = "https://apilist.tronscanapi.com/api"
         self.TELEGRAM_API_BASE = f"https://api.telegram.org/bot{self.TELEGRAM_BOT_TOKEN}"
+        # Static parts of every sendMessage call; each send only adds the text
+        self._tg_url = f"{self.TELEGRAM_API_BASE}/sendMessage"
+        self._tg_payload_base = {
+            "chat_id": self.TELEGRAM_CHAT_ID,
+            "parse_mode": "HTML",
+            "disable_web_page_preview": True
+        }
         
-        # Track processed transactions to avoid duplicates
-        self.processed_transactions = set()
-        self.last_check_time = datetime.now() - timedelta(minutes=10)  # Start from 5 minutes ago
+        # Shared HTTP session so TronScan and Telegram connections are kept alive between polls
+        self.session = requests.Session()
+        # Transient TronScan failures (429, 5xx) are retried with exponential backoff,
+        # honouring Retry-After, before a request is reported as failed
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            respect_retry_after_header=True
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        self.session.mount("https://", adapter)
+        # sendMessage is not idempotent: after a read timeout or 5xx Telegram may already
+        # have delivered it, so only retry on connection errors and on an explicit 429
+        telegram_retry = Retry(
+            total=3,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=[429],
+            allowed_methods=["POST"],
+            respect_retry_after_header=True
+        )
+        self.session.mount("https://api.telegram.org/", HTTPAdapter(max_retries=telegram_retry))
+        # Only sent to TronScan, so the API key never reaches api.telegram.org
+        self._tronscan_headers = {'TRON-PRO-API-KEY': self.TRONSCAN_API_KEY} if self.TRONSCAN_API_KEY else {}
+        # Worker threads used to overlap the TronScan fetches
+        self._executor = ThreadPoolExecutor(max_workers=8)
+        # Caps concurrent TronScan token requests to stay friendly with its rate limit
+        self._tronscan_slots = threading.BoundedSemaphore(4)
+        # Every send goes to the single TELEGRAM_CHAT_ID, and Telegram asks for about one
+        # message per second per chat (the ~30 msg/s figure is across all chats)
+        self._tg_limiter = _RateLimiter(1, 1)
+        
+        # Track processed transactions to avoid duplicates with two rotating Bloom filters:
+        # new hashes go into the active one, and once it fills up the older filter is
+        # replaced by an empty one and becomes active, so memory stays bounded and old
+        # hashes are forgotten. A false positive (~0.1%) only costs one skipped notification.
+        self._bloom_capacity = 50_000
+        self._bloom = [self._new_bloom(), self._new_bloom()]
+        self._bloom_count = [0, 0]
+        self._active = 0
+        
+        # Newest block timestamps (ms) seen so far; 0 means do a full-window scan
+        self._last_ts_trc20 = 0
+        self._last_ts_trx = 0
         
         # Validate configuration
         self._validate_config()
+        
+        # Processed hashes are persisted so a restart neither re-notifies nor skips the downtime
+        self._db = sqlite3.connect(self.STATE_DB)
+        self._db.execute('CREATE TABLE IF NOT EXISTS seen(hash TEXT PRIMARY KEY, ts INTEGER)')
+        for (tx_hash,) in self._db.execute('SELECT hash FROM seen'):
+            self._mark_processed(tx_hash)
+        
+        # Last check time in epoch milliseconds, comparable with TronScan timestamps as-is.
+        # Resume from the newest persisted transaction, else start from 10 minutes ago.
+        default_check_time_ms = int((datetime.now() - timedelta(minutes=10)).timestamp() * 1000)
+        self.last_check_time_ms = self._db.execute(
+            'SELECT COALESCE(MAX(ts), ?) FROM seen', (default_check_time_ms,)
+        ).fetchone()[0]
+        
+        # Resolve API hosts up front so the first connections don't wait on DNS
+        self._warm_dns()
 
     def _validate_config(self):
         """Validate that all required configuration is set"""
@@ -47,12 +189,25 @@ class TronTransactionMonitor:
             raise ValueError("Please set TELEGRAM_BOT_TOKEN environment variable")
         if self.TELEGRAM_CHAT_ID == 'YOUR_CHAT_ID_HERE':
             raise ValueError("Please set TELEGRAM_CHAT_ID environment variable")
+        if not 1 <= self.MIN_INTERVAL <= self.MAX_INTERVAL:
+            raise ValueError("MIN_INTERVAL_SECOND must be at least 1 and not above MAX_INTERVAL_SECOND")
+        
+        # Lowercased once for the per-transaction direction check
+        self._wallet_lower = self.WALLET_ADDRESS.lower()
         
         logger.info(f"Monitoring wallet: {self.WALLET_ADDRESS}")
         logger.info(f"Telegram Chat ID: {self.TELEGRAM_CHAT_ID}")
 
+    def _warm_dns(self):
+        """Pre-resolve the TronScan and Telegram hosts to warm the OS resolver cache"""
+        for host in ("apilist.tronscanapi.com", "api.telegram.org"):
+            try:
+                logger.info(f"Resolved {host} to {socket.gethostbyname(host)}")
+            except socket.gaierror as e:
+                logger.warning(f"Could not resolve {host}: {e}")
+
     def get_transactions(self):
-        """Fetch recent transactions from TronScan API"""
+        """Fetch recent transactions from TronScan API (None if the fetch failed)"""
         try:
             url = f"{self.TRONSCAN_API_BASE}/transaction"
             params = {
@@ -62,15 +217,14 @@ class TronTransactionMonitor:
                 'start': 0,
                 'address': self.WALLET_ADDRESS
             }
+            # Only ask for transactions newer than the last one we saw
+            if self._last_ts_trx:
+                params['start_timestamp'] = self._last_ts_trx + 1
             
-            headers = {}
-            if self.TRONSCAN_API_KEY:
-                headers['TRON-PRO-API-KEY'] = self.TRONSCAN_API_KEY
-            
-            response = requests.get(url, params=params, headers=headers, timeout=30)
+            response = self.session.get(url, params=params, headers=self._tronscan_headers, timeout=30)
             response.raise_for_status()
             
-            data = response.json()
+            data = orjson.loads(response.content)
             transactions = data.get('data', [])
             
             logger.info(f"Fetched {len(transactions)} transactions from TronScan")
@@ -78,195 +232,241 @@ class TronTransactionMonitor:
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Error fetching transactions: {e}")
-            return []
-        except json.JSONDecodeError as e:
+            return None
+        except orjson.JSONDecodeError as e:
             logger.error(f"Error parsing JSON response: {e}")
-            return []
+            return None
+
+    def _fetch_token_transfers(self, contract_address, symbol):
+        """Fetch transfers of a single TRC-20 token, tagged with its contract info"""
+        url = f"{self.TRONSCAN_API_BASE}/token_trc20/transfers-with-status"
+        params = {
+            'limit': 50,
+            'start': 0,
+            'trc20Id': contract_address,
+            'address': self.WALLET_ADDRESS,
+            'direction':0
+        }
+        # Only ask for transfers newer than the last one we saw
+        if self._last_ts_trc20:
+            params['start_timestamp'] = self._last_ts_trc20 + 1
+        
+        with self._tronscan_slots:
+            response = self.session.get(url, params=params, headers=self._tronscan_headers, timeout=30)
+        response.raise_for_status()
+        
+        data = orjson.loads(response.content)
+        transfers = data.get('data', [])
+        
+        # Add contract info to each transfer for easier processing
+        for transfer in transfers:
+            transfer['_contract_symbol'] = symbol
+            transfer['_contract_address'] = contract_address
+        
+        return transfers
 
     def get_token_transfers(self):
-        """Fetch TRC-20 token transfers (USDT and other popular tokens)"""
-        all_transfers = []
-        
-        # Popular TRC-20 tokens to monitor
-        TRC20_CONTRACTS = {
-            "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t": "USDT",  # Tether USD
-        #     "TEkxiTehnzSmSe2XqrBj4w32RUN966rdz8": "USDC",   # USD Coin  
-        #     "TUpMhErZL2fhh4sVNULAbNKLokS4GjC1F4": "TUSD",   # TrueUSD
-        #     "TLf2b2kPL7joeax6PmGZeQjEFnTEk8bsHH": "BTT",    # BitTorrent Token
+        """Fetch TRC-20 token transfers (USDT and other popular tokens), None if any token failed"""
+        # Fetch all tokens concurrently instead of one request (and sleep) at a time
+        futures = {
+            self._executor.submit(self._fetch_token_transfers, contract_address, symbol): symbol
+            for contract_address, symbol in TRC20_CONTRACTS.items()
         }
         
-        try:
-            for contract_address, symbol in TRC20_CONTRACTS.items():
-                url = f"{self.TRONSCAN_API_BASE}/token_trc20/transfers-with-status"
-                params = {
-                    'limit': 50,  # Reduced limit per token to avoid too many requests
-                    'start': 0,
-                    'trc20Id': contract_address,
-                    'address': self.WALLET_ADDRESS,
-                    'direction':0
-                }
-                
-                headers = {}
-                if self.TRONSCAN_API_KEY:
-                    headers['TRON-PRO-API-KEY'] = self.TRONSCAN_API_KEY
-                
-                response = requests.get(url, params=params, headers=headers, timeout=30)
-                response.raise_for_status()
-                
-                data = response.json()
-                transfers = data.get('data', [])
-                
-                # Add contract info to each transfer for easier processing
-                for transfer in transfers:
-                    transfer['_contract_symbol'] = symbol
-                    transfer['_contract_address'] = contract_address
-                
-                all_transfers.extend(transfers)
-                time.sleep(0.5)  # Small delay between requests to avoid rate limiting
-            
-            logger.info(f"Fetched {len(all_transfers)} total token transfers from TronScan")
-            return all_transfers
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching token transfers: {e}")
-            return []
+        results = []
+        failed = False
+        for future, symbol in futures.items():
+            try:
+                results.append(future.result())
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error fetching {symbol} token transfers: {e}")
+                failed = True
+            except orjson.JSONDecodeError as e:
+                logger.error(f"Error parsing {symbol} JSON response: {e}")
+                failed = True
+        
+        # A partial result would advance the shared fetch window past the failed tokens
+        if failed:
+            return None
+        
+        all_transfers = list(chain.from_iterable(results))
+        logger.info(f"Fetched {len(all_transfers)} total token transfers from TronScan")
+        return all_transfers
+
+    def _post_telegram(self, message, parse_mode='HTML'):
+        """Send message to Telegram, raising on failure"""
+        payload = {**self._tg_payload_base, "parse_mode": parse_mode, "text": message}
+        
+        self._tg_limiter.acquire()
+        response = self.session.post(self._tg_url, data=payload, timeout=30)
+        response.raise_for_status()
+        
+        logger.info("Telegram notification sent successfully")
+        return orjson.loads(response.content)
 
     def send_telegram_message(self, message, parse_mode='HTML'):
         """Send message to Telegram"""
         try:
-            url = f"{self.TELEGRAM_API_BASE}/sendMessage"
-            data = {
-                "chat_id": self.TELEGRAM_CHAT_ID,
-                "text": message,
-                "parse_mode": parse_mode,
-                "disable_web_page_preview": True
-            }
-            
-            response = requests.post(url, data=data, timeout=30)
-            response.raise_for_status()
-            
-            logger.info("Telegram notification sent successfully")
-            return response.json()
+            return self._post_telegram(message, parse_mode)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Error sending Telegram message: {e}")
             return None
+        except orjson.JSONDecodeError as e:
+            logger.error(f"Error parsing Telegram response: {e}")
+            return None
+
+    def _deliver(self, message):
+        """Send a notification; return 'sent', 'rejected' (permanent 4xx) or 'failed' (worth retrying)"""
+        try:
+            self._post_telegram(message)
+            return "sent"
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            # Anything but 429 in the 4xx range (e.g. bad HTML) fails the same way every time
+            if status is not None and 400 <= status < 500 and status != 429:
+                logger.error(f"Telegram rejected message ({status}): {e}")
+                return "rejected"
+            logger.error(f"Error sending Telegram message: {e}")
+            return "failed"
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error sending Telegram message: {e}")
+            return "failed"
+        except orjson.JSONDecodeError as e:
+            # The 2xx status already means Telegram accepted it
+            logger.warning(f"Error parsing Telegram response: {e}")
+            return "sent"
+
+    def _flush_messages(self, pending):
+        """Send (message, row) pairs as size-limited digests; return the rows needing no retry and whether any do"""
+        batches = []
+        batch, items = "", []
+        for message, row in pending:
+            if batch and len(batch) + len(MESSAGE_SEPARATOR) + len(message) > MAX_BATCH_CHARS:
+                batches.append((batch, items))
+                batch, items = message, [(message, row)]
+            else:
+                batch = f"{batch}{MESSAGE_SEPARATOR}{message}" if batch else message
+                items.append((message, row))
+        if batch:
+            batches.append((batch, items))
+        
+        handled_rows = []
+        retry_needed = False
+        for batch, items in batches:
+            result = self._deliver(batch)
+            if result == "rejected" and len(items) > 1:
+                # One bad message rejects the whole digest, so send its messages one by one
+                results = [(self._deliver(message), row) for message, row in items]
+            else:
+                results = [(result, row) for _, row in items]
+            
+            for result, row in results:
+                if result == "failed":
+                    retry_needed = True
+                else:
+                    if result == "rejected":
+                        logger.error(f"Dropping notification for {row[0]} after permanent rejection")
+                    handled_rows.append(row)
+        return handled_rows, retry_needed
 
     def format_transaction_message(self, tx):
         """Format transaction data into readable Telegram message"""
         try:
-            tx_hash = tx.get('hash', 'N/A')
-            timestamp = tx.get('timestamp', 0)
-            block = tx.get('block', 'N/A')
+            # Get transaction details in one lookup, falling back to defaults if a field is missing
+            try:
+                tx_hash, timestamp, block, from_addr, to_addr, raw_amount, contract_type = _TX_GET(tx)
+            except KeyError:
+                tx_hash = tx.get('hash', 'N/A')
+                timestamp = tx.get('timestamp', 0)
+                block = tx.get('block', 'N/A')
+                from_addr = tx.get('ownerAddress', 'N/A')
+                to_addr = tx.get('toAddress', 'N/A')
+                raw_amount = tx.get('amount', 0)
+                contract_type = tx.get('contractType', 'Unknown')
             
             # Convert timestamp to readable format
-            if timestamp:
-                try:
-                    dt = datetime.fromtimestamp(int(timestamp) / 1000)
-                    time_str = dt.strftime('%Y-%m-%d %H:%M:%S UTC')
-                except (ValueError, TypeError):
-                    time_str = 'N/A'
-            else:
+            try:
+                time_str = _fmt_ts(int(timestamp)) if timestamp else 'N/A'
+            except (ValueError, TypeError):
                 time_str = 'N/A'
             
-            # Get transaction details
-            from_addr = tx.get('ownerAddress', 'N/A')
-            to_addr = tx.get('toAddress', 'N/A')
-            raw_amount = tx.get('amount', 0)
-            contract_type = tx.get('contractType', 'Unknown')
-            
             # Safe amount conversion
             try:
-                if isinstance(raw_amount, str):
-                    amount = float(raw_amount)
-                else:
-                    amount = float(raw_amount) if raw_amount else 0
-                amount_trx = amount / 1_000_000
+                amount = int(raw_amount) if raw_amount else 0
+                amount_trx = _fmt_amount(amount, 6)  # 1 TRX = 1,000,000 SUN
             except (ValueError, TypeError):
-                amount_trx = 0
+                amount_trx = _fmt_amount(0, 6)
                 logger.warning(f"Could not parse amount: {raw_amount}")
             
             # Determine if incoming or outgoing
-            direction = "📥 Incoming" if to_addr.lower() == self.WALLET_ADDRESS.lower() else "📤 Outgoing"
-            
-            message = f"🔔 <b>New TRX Transaction!</b>\n\n"
-            message += f"{direction}\n"
-            message += f"💰 <b>Amount:</b> {amount_trx:.6f} TRX\n"
-            message += f"👤 <b>From:</b> <code>{from_addr}</code>\n"
-            message += f"👤 <b>To:</b> <code>{to_addr}</code>\n"
-            message += f"📝 <b>Type:</b> {contract_type}\n"
-            message += f"🕒 <b>Time:</b> {time_str}\n"
-            message += f"📦 <b>Block:</b> {block}\n"
-            message += f"📋 <b>Hash:</b> <code>{tx_hash}</code>\n\n"
-            message += f"🔍 <a href='https://tronscan.org/#/transaction/{tx_hash}'>View on TronScan</a>"
+            direction = "📥 Incoming" if to_addr.lower() == self._wallet_lower else "📤 Outgoing"
+            
+            message = (
+                f"🔔 <b>New TRX Transaction!</b>\n\n"
+                f"{direction}\n"
+                f"💰 <b>Amount:</b> {amount_trx} TRX\n"
+                f"👤 <b>From:</b> <code>{from_addr}</code>\n"
+                f"👤 <b>To:</b> <code>{to_addr}</code>\n"
+                f"📝 <b>Type:</b> {contract_type}\n"
+                f"🕒 <b>Time:</b> {time_str}\n"
+                f"📦 <b>Block:</b> {block}\n"
+                f"📋 <b>Hash:</b> <code>{tx_hash}</code>\n\n"
+                f"🔍 <a href='https://tronscan.org/#/transaction/{tx_hash}'>View on TronScan</a>"
+            )
             
             return message
             
         except Exception as e:
             logger.error(f"Error formatting transaction message: {e}")
-            logger.error(f"Transaction data: {json.dumps(tx, indent=2)}")
+            logger.error("Transaction data: %r", tx)
             return f"🔔 New transaction detected: {tx.get('hash', 'Unknown')}"
 
     def format_token_transfer_message(self, transfer):
         """Format token transfer data into readable Telegram message"""
         try:
-            tx_hash = transfer.get('hash', 'N/A')
-            timestamp = transfer.get('block_timestamp', 0)
-            block = transfer.get('block', 'N/A')
+            # Get transfer details from new API structure in one lookup, falling back to
+            # defaults if a field is missing
+            try:
+                (tx_hash, timestamp, block, from_addr, to_addr, raw_amount, token_name,
+                 decimals, contract_address, status, direction) = _TRANSFER_GET(transfer)
+            except KeyError:
+                tx_hash = transfer.get('hash', 'N/A')
+                timestamp = transfer.get('block_timestamp', 0)
+                block = transfer.get('block', 'N/A')
+                from_addr = transfer.get('from', 'N/A')
+                to_addr = transfer.get('to', 'N/A')
+                raw_amount = transfer.get('amount', 0)
+                token_name = transfer.get('token_name', 'Unknown Token')
+                decimals = transfer.get('decimals', 0)
+                contract_address = transfer.get('contract_address', 'N/A')
+                status = transfer.get('status', 0)
+                direction = transfer.get('direction', 0)
             
             # Convert timestamp to readable format
-            if timestamp:
-                try:
-                    dt = datetime.fromtimestamp(int(timestamp) / 1000)
-                    time_str = dt.strftime('%Y-%m-%d %H:%M:%S UTC')
-                except (ValueError, TypeError):
-                    time_str = 'N/A'
-            else:
+            try:
+                time_str = _fmt_ts(int(timestamp)) if timestamp else 'N/A'
+            except (ValueError, TypeError):
                 time_str = 'N/A'
             
-            # Get transfer details from new API structure
-            from_addr = transfer.get('from', 'N/A')
-            to_addr = transfer.get('to', 'N/A')
-            raw_amount = transfer.get('amount', 0)
-            token_name = transfer.get('token_name', 'Unknown Token')
-            decimals = transfer.get('decimals', 0)
-            contract_address = transfer.get('contract_address', 'N/A')
-            status = transfer.get('status', 0)
-            direction = transfer.get('direction', 0)
-            
             # Get token symbol from contract address or fallback
-            contract_address = transfer.get('contract_address', 'N/A')
             token_symbol = transfer.get('_contract_symbol')  # Added by our code
             
             if not token_symbol:
                 # Fallback to known contracts
-                known_contracts = {
-                    "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t": "USDT",
-                    # "TEkxiTehnzSmSe2XqrBj4w32RUN966rdz8": "USDC",
-                    # "TUpMhErZL2fhh4sVNULAbNKLokS4GjC1F4": "TUSD",
-                    # "TLf2b2kPL7joeax6PmGZeQjEFnTEk8bsHH": "BTT"
-                }
-                token_symbol = known_contracts.get(contract_address, "UNK")
+                token_symbol = TRC20_CONTRACTS.get(contract_address, "UNK")
             
             # Safe amount conversion
             try:
-                if isinstance(raw_amount, str):
-                    amount = float(raw_amount)
-                else:
-                    amount = float(raw_amount) if raw_amount else 0
-                    
-                # Convert decimals safely
-                if isinstance(decimals, str):
-                    decimals = int(decimals)
-                elif not isinstance(decimals, int):
-                    decimals = 0
-                    
+                amount = int(raw_amount) if raw_amount else 0
+                decimals = int(decimals) if decimals else 0
+                
                 # Calculate actual amount
-                actual_amount = amount / (10 ** decimals) if decimals > 0 else amount
+                actual_amount = _fmt_amount(amount, decimals, grouping=True)
                 
             except (ValueError, TypeError) as e:
                 logger.warning(f"Could not parse token amount: {raw_amount}, decimals: {decimals}, error: {e}")
-                actual_amount = 0
+                actual_amount = _fmt_amount(0, 0, grouping=True)
             
             # Determine direction based on addresses and direction field
             if direction == 1:  # Outgoing
@@ -277,88 +477,136 @@ class TronTransactionMonitor:
             # Status text
             status_text = "✅ Success" if status == 0 else f"⚠️ Status: {status}"
             
-            message = f"🪙 <b>New {token_symbol} Transfer!</b>\n\n"
-            message += f"{direction_text}\n"
-            message += f"💰 <b>Amount:</b> {actual_amount:,.6f} {token_symbol}\n"
-            message += f"🏷️ <b>Token:</b> {token_name} ({token_symbol})\n"
-            message += f"👤 <b>From:</b> <code>{from_addr}</code>\n"
-            message += f"👤 <b>To:</b> <code>{to_addr}</code>\n"
-            message += f"📋 <b>Status:</b> {status_text}\n"
-            message += f"🕒 <b>Time:</b> {time_str}\n"
-            message += f"📦 <b>Block:</b> {block}\n"
-            message += f"📋 <b>Hash:</b> <code>{tx_hash}</code>\n\n"
-            message += f"🔍 <a href='https://tronscan.org/#/transaction/{tx_hash}'>View on TronScan</a>"
+            message = (
+                f"🪙 <b>New {token_symbol} Transfer!</b>\n\n"
+                f"{direction_text}\n"
+                f"💰 <b>Amount:</b> {actual_amount} {token_symbol}\n"
+                f"🏷️ <b>Token:</b> {token_name} ({token_symbol})\n"
+                f"👤 <b>From:</b> <code>{from_addr}</code>\n"
+                f"👤 <b>To:</b> <code>{to_addr}</code>\n"
+                f"📋 <b>Status:</b> {status_text}\n"
+                f"🕒 <b>Time:</b> {time_str}\n"
+                f"📦 <b>Block:</b> {block}\n"
+                f"📋 <b>Hash:</b> <code>{tx_hash}</code>\n\n"
+                f"🔍 <a href='https://tronscan.org/#/transaction/{tx_hash}'>View on TronScan</a>"
+            )
             
             return message
             
         except Exception as e:
             logger.error(f"Error formatting token transfer message: {e}")
-            logger.error(f"Transfer data: {json.dumps(transfer, indent=2)}")
+            logger.error("Transfer data: %r", transfer)
             return f"🪙 New token transfer detected: {transfer.get('hash', 'Unknown')}"
 
+    def _new_bloom(self):
+        """Create an empty Bloom filter for processed transaction hashes"""
+        return BloomFilter(capacity=self._bloom_capacity, error_rate=1e-3)
+
+    def _is_processed(self, tx_hash):
+        """Check whether either Bloom filter has seen this transaction hash"""
+        return tx_hash in self._bloom[0] or tx_hash in self._bloom[1]
+
+    def _mark_processed(self, tx_hash):
+        """Record a processed hash, rotating the Bloom filters when the active one is full"""
+        if self._bloom_count[self._active] >= self._bloom_capacity:
+            self._active ^= 1
+            self._bloom[self._active] = self._new_bloom()
+            self._bloom_count[self._active] = 0
+        
+        self._bloom[self._active].add(tx_hash)
+        self._bloom_count[self._active] += 1
+
+    def _save_processed(self, rows, now_ms):
+        """Persist (hash, timestamp) rows and purge entries older than 24 hours"""
+        with self._db:
+            self._db.executemany('INSERT OR IGNORE INTO seen VALUES(?, ?)', rows)
+            self._db.execute('DELETE FROM seen WHERE ts < ?', (now_ms - SEEN_RETENTION_MS,))
+
     def is_new_transaction(self, tx_hash, timestamp):
         """Check if transaction is new (not processed before and within time window)"""
-        if tx_hash in self.processed_transactions:
+        if self._is_processed(tx_hash):
             return False
         
         # Check if transaction is newer than last check
-        if timestamp:
-            tx_time = datetime.fromtimestamp(timestamp / 1000)
-            if tx_time <= self.last_check_time:
-                return False
+        if timestamp and timestamp <= self.last_check_time_ms:
+            return False
         
         return True
 
     def process_transactions(self):
-        """Process and notify about new transactions"""
+        """Process and notify about new transactions, returning how many were handled"""
         logger.info("Checking for new transactions...")
         
         new_transactions_found = 0
         current_time = datetime.now()
         
-
-        
-        # Get token transfers
+        # Fetch TRX transactions in the background while token transfers are fetched
+        transactions_future = self._executor.submit(self.get_transactions)
         transfers = self.get_token_transfers()
+        transactions = transactions_future.result()
+        
+        fetch_failed = transfers is None or transactions is None
+        transfers = transfers or []
+        transactions = transactions or []
+        
+        # Hashes are only recorded once their digest is delivered, so a failed send is retried
+        # next cycle. pending_hashes stops a transaction returned by both endpoints being listed twice.
+        pending = []
+        pending_hashes = set()
         for transfer in transfers:
             tx_hash = transfer.get('hash')
             timestamp = transfer.get('block_timestamp', 0)
             
-            if tx_hash and self.is_new_transaction(tx_hash, timestamp):
-                message = self.format_token_transfer_message(transfer)
-                self.send_telegram_message(message)
-                self.processed_transactions.add(tx_hash)
+            if tx_hash and tx_hash not in pending_hashes and self.is_new_transaction(tx_hash, timestamp):
+                pending.append((self.format_token_transfer_message(transfer), (tx_hash, timestamp)))
+                pending_hashes.add(tx_hash)
                 new_transactions_found += 1
-                time.sleep(1)  # Avoid rate limiting
         
-        # Get TRX transactions
-        transactions = self.get_transactions()
         for tx in transactions:
             tx_hash = tx.get('hash')
             timestamp = tx.get('timestamp', 0)
             
-            if tx_hash and self.is_new_transaction(tx_hash, timestamp):
-                message = self.format_transaction_message(tx)
-                self.send_telegram_message(message)
-                self.processed_transactions.add(tx_hash)
+            if tx_hash and tx_hash not in pending_hashes and self.is_new_transaction(tx_hash, timestamp):
+                pending.append((self.format_transaction_message(tx), (tx_hash, timestamp)))
+                pending_hashes.add(tx_hash)
                 new_transactions_found += 1
-                time.sleep(1)  # Avoid rate limiting
-        # Update last check time
-        self.last_check_time = current_time
         
-        # Clean up old processed transactions (keep only last 1000)
-        if len(self.processed_transactions) > 1000:
-            self.processed_transactions = set(list(self.processed_transactions)[-500:])
+        # Send everything found this cycle as few Telegram messages as possible
+        handled_rows, retry_needed = self._flush_messages(pending)
+        
+        # Persist only what was delivered (or permanently rejected). A crash between sending
+        # and this commit can re-notify those transactions after a restart, but never drops them.
+        for tx_hash, _ in handled_rows:
+            self._mark_processed(tx_hash)
+        self._save_processed(handled_rows, int(current_time.timestamp() * 1000))
+        
+        # A failed fetch or transient send failure keeps the windows where they are so they are
+        # retried next cycle
+        if fetch_failed or retry_needed:
+            logger.warning("Some fetches or notifications failed; keeping last check time to retry the window")
+        else:
+            # Advance the incremental fetch windows past everything returned this cycle
+            if transfers:
+                self._last_ts_trc20 = max(self._last_ts_trc20, max(t.get('block_timestamp', 0) for t in transfers))
+            if transactions:
+                self._last_ts_trx = max(self._last_ts_trx, max(t.get('timestamp', 0) for t in transactions))
+            
+            # Update last check time
+            self.last_check_time_ms = int(current_time.timestamp() * 1000)
         
         if new_transactions_found > 0:
             logger.info(f"Found and processed {new_transactions_found} new transactions")
         else:
             logger.info("No new transactions found")
+        
+        # Undelivered transactions are found again every cycle during a Telegram outage, so
+        # only handled ones count as activity; otherwise the loop would speed up, not back off
+        return len(handled_rows)
 
     def debug_transaction_data(self, tx):
         """Debug function to inspect transaction data structure"""
         logger.info("=== TRANSACTION DATA DEBUG ===")
-        logger.info(f"Full transaction data: {json.dumps(tx, indent=2)}")
+        logger.info(f"Full transaction data: {orjson.dumps(tx, option=orjson.OPT_INDENT_2).decode()}")
         
         # Check specific fields that might cause issues
         amount = tx.get('amount', 'NOT_FOUND')
@@ -382,9 +630,9 @@ class TronTransactionMonitor:
                 'address': self.WALLET_ADDRESS
             }
             
-            response = requests.get(url, params=params, timeout=30)
+            response = self.session.get(url, params=params, headers=self._tronscan_headers, timeout=30)
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
             
             logger.info("=== API RESPONSE TEST ===")
             logger.info(f"Response keys: {list(data.keys())}")
@@ -406,12 +654,19 @@ class TronTransactionMonitor:
         message = (
             f"🚀 <b>TronScan Monitor Started!</b>\n\n"
             f"👀 Monitoring wallet: <code>{self.WALLET_ADDRESS}</code>\n"
-            f"⏰ Check interval: {self.INTERVAL} (seconds)\n"
-            f"🕒 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}\n\n"
+            f"⏰ Check interval: {self._cur_interval} (seconds, adapts between {self.MIN_INTERVAL} and {self.MAX_INTERVAL})\n"
+            f"🕒 Started at: {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}\n\n"
             f"You will receive notifications for all incoming and outgoing transactions."
         )
         self.send_telegram_message(message)
 
+    def _adjust_interval(self, delivered):
+        """Halve the poll interval after delivering notifications, back off by 5s otherwise"""
+        if delivered > 0:
+            self._cur_interval = max(self.MIN_INTERVAL, self._cur_interval // 2)
+        else:
+            self._cur_interval = min(self.MAX_INTERVAL, self._cur_interval + 5)
+
     def run(self):
         """Main monitoring loop"""
         logger.info("Starting TronScan Transaction Monitor...")
@@ -421,16 +676,17 @@ class TronTransactionMonitor:
         
         while True:
             try:
-                self.process_transactions()
-                logger.info("Waiting 60 seconds until next check...")
-                time.sleep(self.INTERVAL)  # Wait 1 minute
+                delivered = self.process_transactions()
+                self._adjust_interval(delivered)
+                logger.info(f"Waiting {self._cur_interval} seconds until next check...")
+                time.sleep(self._cur_interval)
                 
             except KeyboardInterrupt:
                 logger.info("Monitor stopped by user")
                 break
             except Exception as e:
                 logger.error(f"Unexpected error in main loop: {e}")
-                time.sleep(self.INTERVAL)  # Wait before retrying
+                time.sleep(self._cur_interval)  # Wait before retrying
 
 if __name__ == "__main__":
     monitor = TronTransactionMonitor()